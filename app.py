@@ -2,10 +2,13 @@ import os
 import re
 import sys
 import io
+import csv
 import math
-import uuid
 import random
+import shutil
+import asyncio
 import importlib
+import importlib.util
 import streamlit as st
 from streamlit.components.v1 import html
 
@@ -18,12 +21,18 @@ st.set_page_config(page_title="AI Study Buddy", layout="wide")
 # Lazy import of utils (prevents blank screen on errors)
 # =========================
 UTILS_ERROR = None
-generate_summary = generate_flashcards = generate_quiz = None
+generate_summary = generate_all = None
+generate_summary_batch = generate_all_batch = None
+APITimeoutError = APIError = TimeoutError
 try:
     _utils = importlib.import_module("utils")
     generate_summary = getattr(_utils, "generate_summary")
-    generate_flashcards = getattr(_utils, "generate_flashcards")
-    generate_quiz = getattr(_utils, "generate_quiz")
+    generate_all = getattr(_utils, "generate_all")
+    generate_summary_batch = getattr(_utils, "generate_summary_batch")
+    generate_all_batch = getattr(_utils, "generate_all_batch")
+    _openai = importlib.import_module("openai")
+    APITimeoutError = getattr(_openai, "APITimeoutError")
+    APIError = getattr(_openai, "APIError")
 except Exception as e:
     UTILS_ERROR = f"{e.__class__.__name__}: {e}"
 
@@ -65,18 +74,6 @@ st.markdown("""
   box-shadow: 0 10px 24px rgba(0,0,0,.22), inset 0 1px 0 rgba(255,255,255,.04);
 }
 
-/* Tab headers */
-[data-baseweb="tab-list"] { gap: 6px; }
-[data-baseweb="tab"] {
-  border-radius: 10px !important;
-  background: rgba(255,255,255,.02);
-  border: 1px solid transparent;
-}
-[data-baseweb="tab"][aria-selected="true"] {
-  background: rgba(99,102,241,.18);
-  border-color: rgba(99,102,241,.35);
-}
-
 /* Buttons */
 .stButton>button {
   border-radius: 12px;
@@ -128,6 +125,9 @@ card_height = st.sidebar.slider("Card height (px)", 140, 300, 190, 10)
 min_card_width = st.sidebar.slider("Min card width (px)", 220, 380, 270, 10)
 grid_gap = st.sidebar.slider("Grid gap (px)", 8, 28, 16, 2)
 
+economy_mode = st.sidebar.checkbox("Economy mode (slower, 50% cheaper)", value=False,
+                                   help="Submit generation through the OpenAI Batch API; results can take several minutes.")
+
 generate_button = st.sidebar.button("✨ Generate / Refresh")
 
 with st.sidebar.expander("⚙️ Health check", expanded=False):
@@ -148,7 +148,9 @@ if UTILS_ERROR:
 ss = st.session_state
 ss.setdefault("generated_topic", None)
 ss.setdefault("summary", "")
+ss.setdefault("summary_parsed", [])  # [[sentences] per paragraph] for the visual map
 ss.setdefault("flashcards", [])
+ss.setdefault("flashcards_blob", [])
 ss.setdefault("quiz", [])
 ss.setdefault("answers", {})
 ss.setdefault("score", 0)
@@ -156,38 +158,59 @@ ss.setdefault("flashcard_count", flashcard_count)
 ss.setdefault("quiz_count", quiz_count)
 ss.setdefault("flashcards_order", [])
 ss.setdefault("quiz_epoch", 0)   # bump to force radios to reset
+ss.setdefault("quiz_submitted", False)  # keeps the score table across reruns / section switches
+# Widgets in hidden sections are unmounted and lose their state; keep a copy here
+ss.setdefault("kept_widgets", {"leaves": 4, "wrap_len": 24, "layout": "TB (top→bottom)", "card_search": "",
+                                 "show_csv": False})
+ss.setdefault("cards_sig", None)  # (topic, n, summary hash) of the current flashcards
+ss.setdefault("quiz_sig", None)   # same for the current MCQs
 
-# =========================
-# Generate content (summary anchors flashcards/MCQs)
-# =========================
-if generate_button:
-    with st.spinner("Generating content…"):
-        if topic != ss.generated_topic or not ss.summary:
-            ss.summary = generate_summary(topic)
-            ss.generated_topic = topic
-        ss.flashcards = generate_flashcards(topic, n=flashcard_count, summary=ss.summary)
-        ss.quiz = generate_quiz(topic, n=quiz_count, summary=ss.summary)
-        ss.answers = {f"quiz_{i}": None for i in range(len(ss.quiz))}
-        ss.flashcard_count = flashcard_count
-        ss.quiz_count = quiz_count
-        ss.flashcards_order = list(range(len(ss.flashcards)))
-        ss.quiz_epoch += 1  # ensure MCQs start unselected
-    st.success("Done! Content updated.")
+def _restore_widget(key):
+    """Re-seed a section widget from its kept value when its section was hidden."""
+    if key not in ss:
+        ss[key] = ss.kept_widgets[key]
+
+def _keep_widget(key):
+    ss.kept_widgets[key] = ss[key]
+
+QUIZ_PLACEHOLDER = "— Select an answer —"
+
+def _record_answer(qid, key):
+    choice = ss[key]
+    ss.answers[qid] = None if choice == QUIZ_PLACEHOLDER else choice
+    ss.quiz_submitted = False  # score must be re-submitted after a change
+
+def _reset_quiz():
+    ss.answers = {f"quiz_{i}": None for i in range(len(ss.quiz))}
+    ss.quiz_submitted = False
+    ss.quiz_epoch += 1  # force radios back to placeholder
+
+def _card_blobs(cards):
+    """Lowercased question+answer per card, built once for the search box."""
+    return [(c.get("question","") + " " + c.get("answer","")).lower() for c in cards]
 
 # =========================
 # Helpers: summary → diagram
 # =========================
+_TAG_RE = re.compile(r"<[^>]+>")
+_PARA_RE = re.compile(r"<p[^>]*>(.*?)</p>", re.S)
+_SENT_RE = re.compile(r"(?<=[.!?])\s+")
+
 def _strip_html(text):
-    return re.sub(r"<[^>]+>", "", text or "")
+    return _TAG_RE.sub("", text or "")
 
 def _split_paragraphs(summary_html):
-    paras = re.findall(r"<p[^>]*>(.*?)</p>", summary_html or "", flags=re.S)
+    paras = _PARA_RE.findall(summary_html or "")
     if not paras:
         paras = [p.strip() for p in (summary_html or "").split("\n\n") if p.strip()]
     return [_strip_html(p).strip() for p in paras[:3]]
 
 def _sentences(s):
-    return [p.strip() for p in re.split(r"(?<=[.!?])\\s+", (s or "").strip()) if p.strip()]
+    return [p.strip() for p in _SENT_RE.split((s or "").strip()) if p.strip()]
+
+def _parse_summary(summary_html):
+    """Sentences per paragraph, computed once per summary for the diagram."""
+    return [_sentences(p) for p in _split_paragraphs(summary_html)]
 
 def _shorten(sentence, max_words=12):
     words = (sentence or "").split()
@@ -203,8 +226,7 @@ def _wrap_label(text, max_len=24):
     if line: lines.append(line)
     return "\\n".join(lines)
 
-def build_summary_dot(topic, summary_html, leaves_per_para=4, wrap_len=24, orientation="TB"):
-    paras = _split_paragraphs(summary_html)
+def build_summary_dot(topic, parsed, leaves_per_para=4, wrap_len=24, orientation="TB"):
     heads = [
         "Definition & Building Blocks",
         "Architecture • Security • Ops",
@@ -220,8 +242,8 @@ def build_summary_dot(topic, summary_html, leaves_per_para=4, wrap_len=24, orien
         bid = f"b{i}"
         g.append(f'{bid} [label="{_wrap_label(head, wrap_len)}", fillcolor="#0b1320", fontsize=12, color="#93c5fd"];')
         g.append(f"root -> {bid};")
-        if i < len(paras):
-            sents = _sentences(paras[i])[:leaves_per_para]
+        if i < len(parsed):
+            sents = parsed[i][:leaves_per_para]
             for j, sent in enumerate(sents):
                 lid = f"l{i}_{j}"
                 g.append(f'{lid} [label="{_wrap_label(_shorten(sent, 12), wrap_len)}", fillcolor="#0f172a", color="#334155"];')
@@ -229,39 +251,134 @@ def build_summary_dot(topic, summary_html, leaves_per_para=4, wrap_len=24, orien
     g.append("}")
     return "\n".join(g)
 
-# CSV helper (avoids backslashes inside f-strings)
-def csv_escape(text):
-    """Escape double quotes and flatten newlines for CSV."""
-    return (text or "").replace('"', '""').replace("\n", " ").strip()
+@st.cache_resource(show_spinner=False)
+def _graphviz_available():
+    """Whether the graphviz package and `dot` binary are usable; checked once per process."""
+    return importlib.util.find_spec("graphviz") is not None and shutil.which("dot") is not None
+
+@st.cache_resource(show_spinner=False)
+def render_dot(dot):
+    """Lay out DOT server-side once per unique graph; returns SVG markup."""
+    import graphviz  # optional: callers check _graphviz_available() first
+    return graphviz.Source(dot).pipe(format="svg").decode("utf-8")
+
+@st.cache_data(show_spinner=False)
+def cached_dot(topic, parsed, leaves_per_para, wrap_len, orientation):
+    return build_summary_dot(topic, parsed, leaves_per_para=leaves_per_para,
+                             wrap_len=wrap_len, orientation=orientation)
 
 # =========================
-# FLASHCARDS UI (flip cards) — colorful + safe (no f-string braces)
+# Cached LLM calls (repeat topics / counts skip the API round trip)
 # =========================
-def render_flip_cards(cards, min_width_px=270, height_px=190, gap_px=16, search_query="", order=None):
-    if order is None:
-        order = list(range(len(cards)))
+# (underscored args are not hashed: economy vs. live mode share cache entries)
+@st.cache_data(show_spinner=False, ttl=24 * 3600, max_entries=128)
+def cached_summary(topic, _economy=False):
+    if _economy:
+        return generate_summary_batch(topic)
+    return generate_summary(topic)
+
+def _require_parsed(n_cards, cards, n_quiz, quiz):
+    # Raising keeps st.cache_data from storing an unparseable (empty) reply
+    if n_cards and not cards:
+        raise RuntimeError("the model reply contained no parseable flashcards")
+    if n_quiz and not quiz:
+        raise RuntimeError("the model reply contained no parseable quiz questions")
+
+@st.cache_data(show_spinner=False, ttl=24 * 3600, max_entries=128)
+def cached_study_set(topic, n_cards, n_quiz, summary, _economy=False):
+    # summary is part of the key, so cards/MCQs are tied to the exact summary text.
+    # n_cards / n_quiz of None skips that part (returned as None).
+    if _economy:
+        _, cards, quiz = generate_all_batch(topic, n_cards=n_cards, n_quiz=n_quiz, summary=summary)
+        _require_parsed(n_cards, cards, n_quiz, quiz)
+        return cards, quiz
+
+    # The live preview is created in here so cache hits can replay it.
+    preview, streamed = st.empty(), []
+
+    def _on_card(card):
+        streamed.append(card)
+        preview.markdown(f"🃏 **Flashcard {len(streamed)}/{n_cards}** — {card['question']}")
+
+    try:
+        _, cards, quiz = asyncio.run(generate_all(topic, n_cards=n_cards, n_quiz=n_quiz,
+                                                  summary=summary, on_card=_on_card))
+    finally:
+        preview.empty()  # don't leave a stale progress line above an error
+    _require_parsed(n_cards, cards, n_quiz, quiz)
+    return cards, quiz
 
-    # filter by search term
-    def _match(c):
-        blob = (c.get("question","") + " " + c.get("answer","")).lower()
-        return search_query.lower() in blob if search_query else True
+# =========================
+# Generate content (summary anchors flashcards/MCQs)
+# =========================
+if generate_button:
+    spinner_text = "Waiting on the Batch API (economy mode)…" if economy_mode else "Generating content…"
+    try:
+        with st.spinner(spinner_text):
+            summary = ss.summary
+            if topic != ss.generated_topic or not summary:
+                summary = cached_summary(topic, _economy=economy_mode)
+            # Only regenerate the parts whose (topic, n, summary) actually changed
+            summary_hash = hash(summary)
+            cards_sig = (topic, flashcard_count, summary_hash)
+            quiz_sig = (topic, quiz_count, summary_hash)
+            # an empty deck/quiz is always stale, whatever its signature says
+            need_cards = cards_sig != ss.cards_sig or not ss.flashcards
+            need_quiz = quiz_sig != ss.quiz_sig or not ss.quiz
+            if need_cards or need_quiz:
+                # flashcards + MCQs are fetched concurrently on a cache miss
+                cards, quiz = cached_study_set(topic, flashcard_count if need_cards else None,
+                                               quiz_count if need_quiz else None, summary,
+                                               _economy=economy_mode)
+    except APITimeoutError:
+        # Nothing is written to session state, so the current pack stays intact
+        st.warning("OpenAI timed out after retries — your current study pack is unchanged. Try again shortly.")
+    except (APIError, RuntimeError) as e:
+        # Connection / rate-limit / status errors after retries, client setup,
+        # Batch API and unparseable-reply failures
+        st.error(f"Generation failed: {e} — your current study pack is unchanged.")
+    else:
+        if summary != ss.summary:
+            ss.summary = summary
+            ss.summary_parsed = _parse_summary(summary)
+        ss.generated_topic = topic
+        if need_cards:
+            ss.flashcards = cards
+            ss.flashcards_blob = _card_blobs(ss.flashcards)
+            ss.flashcard_count = flashcard_count
+            ss.flashcards_order = list(range(len(ss.flashcards)))
+            ss.cards_sig = cards_sig
+        if need_quiz:
+            ss.quiz = quiz
+            ss.answers = {f"quiz_{i}": None for i in range(len(ss.quiz))}
+            ss.quiz_count = quiz_count
+            ss.quiz_submitted = False
+            ss.quiz_epoch += 1  # ensure MCQs start unselected
+            ss.quiz_sig = quiz_sig
+        if need_cards or need_quiz:
+            st.success("Done! Content updated.")
+        else:
+            st.info("Already up to date — change the topic or counts to regenerate.")
 
-    filtered_idx = [i for i in order if _match(cards[i])]
-    cards = [cards[i] for i in filtered_idx]
+# Filename stem for all downloads
+slug = (ss.generated_topic or topic).replace(' ', '_').lower()
 
-    cols_guess = max(1, math.floor(1000 / (min_width_px + gap_px)))
-    rows_est = math.ceil(len(cards) / max(1, cols_guess))
-    container_height = min(950, max(380, rows_est * (height_px + gap_px) + 160))
-
-    def esc(s):
-        return (s or "").replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
-
-    items = []
-    for i, c in enumerate(cards, start=1):
-        q = esc(c.get("question", f"Question {i}"))
-        a = esc(c.get("answer", ""))
-        gcls = f"fc-front-{(i % 5) or 5}"
-        items.append(f"""
+# =========================
+# FLASHCARDS UI (flip cards) — colorful; static CSS/JS live in flip_cards.css/.js
+# =========================
+@st.cache_data(show_spinner=False)
+def _flip_assets():
+    """Static CSS/JS for the flip-card iframe, read once."""
+    base = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(base, "flip_cards.css"), encoding="utf-8") as f:
+        css = f.read()
+    with open(os.path.join(base, "flip_cards.js"), encoding="utf-8") as f:
+        js = f.read()
+    return css, js
+
+_ESC_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+_CARD_TMPL = """
         <div class="fc-card" role="button" tabindex="0" aria-label="Flip card {i}">
           <div class="fc-card-inner">
             <div class="fc-card-face fc-front {gcls}">
@@ -276,150 +393,148 @@ def render_flip_cards(cards, min_width_px=270, height_px=190, gap_px=16, search_
             </div>
           </div>
         </div>
-        """)
+        """
+
+def render_flip_cards(cards, min_width_px=270, height_px=190, gap_px=16, search_query="", order=None, blobs=None):
+    if order is None:
+        order = list(range(len(cards)))
+
+    # filter by search term
+    query = (search_query or "").lower()
+    if query:
+        if blobs is None or len(blobs) != len(cards):
+            blobs = _card_blobs(cards)
+        filtered_idx = [i for i in order if query in blobs[i]]
+    else:
+        filtered_idx = list(order)
+    cards = [cards[i] for i in filtered_idx]
+
+    cols_guess = max(1, math.floor(1000 / (min_width_px + gap_px)))
+    rows_est = math.ceil(len(cards) / max(1, cols_guess))
+    container_height = min(950, max(380, rows_est * (height_px + gap_px) + 160))
+
+    def esc(s):
+        return (s or "").translate(_ESC_TABLE)
+
+    fmt = _CARD_TMPL.format
+    items = [
+        fmt(i=i, q=esc(c.get("question", f"Question {i}")), a=esc(c.get("answer", "")),
+            gcls=f"fc-front-{(i % 5) or 5}")
+        for i, c in enumerate(cards, start=1)
+    ]
 
     items_joined = "".join(items)
-    root_id = f"fc-root-{uuid.uuid4().hex[:8]}"
-
-    # Include palette CSS inside the iframe so colors render
-    html_code = """
-    <style>
-      .fc-front-1{background:linear-gradient(135deg,#b3e5fc,#81d4fa);}
-      .fc-front-2{background:linear-gradient(135deg,#f8bbd0,#f48fb1);}
-      .fc-front-3{background:linear-gradient(135deg,#fff59d,#fff176);}
-      .fc-front-4{background:linear-gradient(135deg,#dcedc8,#aed581);}
-      .fc-front-5{background:linear-gradient(135deg,#ffcc80,#ffb74d);}
-      .fc-front-1,.fc-front-2,.fc-front-3,.fc-front-4,.fc-front-5{ color:#0e1117; }
-
-      .fc-wrap { max-height: __CONTH__px; overflow:auto; padding:8px 6px 14px 6px;
-        border-radius:14px; border:1px solid rgba(255,255,255,.08);
-        background: rgba(255,255,255,.03); box-shadow: inset 0 1px 0 rgba(255,255,255,.04); }
-      .fc-toolbar { display:flex; gap:10px; margin:8px 6px 12px 6px; align-items:center; flex-wrap:wrap; }
-      .fc-btn { border:1px solid rgba(255,255,255,.18);
-        background:linear-gradient(180deg, rgba(255,255,255,.10), rgba(255,255,255,.04));
-        padding:6px 12px; border-radius:10px; cursor:pointer; user-select:none; font-size:13px; }
-      .fc-btn:hover { filter:brightness(1.06); }
-      .fc-meta { opacity:.75; font-size:12px; }
-
-      .fc-grid { display:grid; gap: __GAP__px;
-        grid-template-columns: repeat(auto-fit, minmax(__MINW__px, 1fr)); }
-
-      .fc-card { perspective:1100px; height: __HEIGHT__px; cursor:pointer; }
-      .fc-card-inner { position:relative; width:100%; height:100%;
-        transition:transform .5s cubic-bezier(.2,.7,.2,1); transform-style:preserve-3d;
-        border-radius:16px; box-shadow: 0 10px 28px rgba(0,0,0,.35), inset 0 1px 0 rgba(255,255,255,.05); }
-      .fc-card.is-flipped .fc-card-inner { transform: rotateY(180deg); }
-
-      .fc-card-face { position:absolute; inset:0; display:flex; flex-direction:column;
-        align-items:center; justify-content:center; text-align:center; padding:18px;
-        border-radius:16px; backface-visibility:hidden; border:1px solid rgba(0,0,0,.08); }
-
-      .fc-back { transform: rotateY(180deg); background:linear-gradient(135deg,#e8f5e9,#c8e6c9); color:#0e1117; }
-
-      .fc-pill { font-weight:700; font-size:12px; padding:4px 10px; border-radius:999px;
-        background:rgba(255,255,255,.86); color:#0e1117; margin-bottom:10px; border:1px solid rgba(0,0,0,.08); }
-      .fc-text { font-size:16px; line-height:1.4; }
-      .fc-hint { margin-top:10px; font-size:12px; opacity:.6; }
-    </style>
-
-    <div id="__ROOT__" class="fc-root">
+    css, js = _flip_assets()
+    body = f"""
+    <div class="fc-root" style="--fc-conth:{container_height}px; --fc-gap:{gap_px}px; --fc-minw:{min_width_px}px; --fc-height:{height_px}px;">
       <div class="fc-wrap">
         <div class="fc-toolbar">
           <div class="fc-btn" id="flipAll">Flip all</div>
           <div class="fc-btn" id="resetAll">Reset all</div>
           <div class="fc-btn" id="shuffle">Shuffle view</div>
-          <div class="fc-meta">Size: W≥__MINW__px • H=__HEIGHT__px • Gap=__GAP__px • Cards=__COUNT__</div>
+          <div class="fc-meta">Size: W≥{min_width_px}px • H={height_px}px • Gap={gap_px}px • Cards={len(cards)}</div>
         </div>
-        <div class="fc-grid">__ITEMS__</div>
+        <div class="fc-grid">{items_joined}</div>
       </div>
     </div>
-
-    <script>
-      (function(){
-        var root = document.getElementById("__ROOT__");
-        if(!root) return;
-        var cards = Array.prototype.slice.call(root.querySelectorAll('.fc-card'));
-        function flip(c){ c.classList.toggle('is-flipped'); }
-        cards.forEach(function(c){
-          c.addEventListener('click', function(){ flip(c); });
-          c.addEventListener('keydown', function(e){
-            if (e.code === 'Space' || e.key === ' ' || e.key === 'Enter') {
-              e.preventDefault(); flip(c);
-            }
-          });
-        });
-        var flipAll = root.querySelector('#flipAll');
-        var resetAll = root.querySelector('#resetAll');
-        if (flipAll) flipAll.addEventListener('click', function(){
-          cards.forEach(function(c){ c.classList.add('is-flipped'); });
-        });
-        if (resetAll) resetAll.addEventListener('click', function(){
-          cards.forEach(function(c){ c.classList.remove('is-flipped'); });
-        });
-        var shuffleBtn = root.querySelector('#shuffle');
-        if (shuffleBtn) {
-          shuffleBtn.addEventListener('click', function(){
-            var grid = root.querySelector('.fc-grid');
-            var nodes = Array.prototype.slice.call(grid.children);
-            for (var i = nodes.length - 1; i > 0; i--) {
-              var j = Math.floor(Math.random() * (i + 1));
-              grid.insertBefore(nodes[j], nodes[i]);
-            }
-          });
-        }
-      })();
-    </script>
     """
-
-    html_code = (html_code
-                 .replace("__CONTH__", str(container_height))
-                 .replace("__GAP__", str(gap_px))
-                 .replace("__MINW__", str(min_width_px))
-                 .replace("__HEIGHT__", str(height_px))
-                 .replace("__COUNT__", str(len(cards)))
-                 .replace("__ROOT__", root_id)
-                 .replace("__ITEMS__", items_joined))
+    # Palette CSS lives inside the iframe so colors render
+    html_code = f"<style>{css}</style>{body}<script>{js}</script>"
 
     html(html_code, height=container_height, scrolling=False)
 
+# Fragment: search / shuffle / export here rerun only this section. Any full-app
+# rerun (sidebar, section switch, map controls) still executes it and re-sends the iframe.
+@st.fragment
+def _flashcards_section():
+    st.markdown('<div class="section">', unsafe_allow_html=True)
+    st.subheader(f"🃏 Flashcards {f'({len(ss.flashcards)})' if ss.flashcards else ''}")
+    if ss.flashcards:
+        col1, col2, col3 = st.columns([2,1,1])
+        with col1:
+            _restore_widget("card_search")
+            search_q = st.text_input("Search in cards", help="Filter by text in question or answer",
+                                     key="card_search", on_change=_keep_widget, args=("card_search",))
+        with col2:
+            _restore_widget("show_csv")
+            show_csv = st.checkbox("Prepare export", help="Enable to download CSV",
+                                   key="show_csv", on_change=_keep_widget, args=("show_csv",))
+        with col3:
+            if st.button("🔀 Shuffle order"):
+                ss.flashcards_order = ss.flashcards_order or list(range(len(ss.flashcards)))
+                random.shuffle(ss.flashcards_order)
+
+        # Export CSV for flashcards
+        if show_csv:
+            out = io.StringIO()
+            w = csv.writer(out, quoting=csv.QUOTE_ALL)
+            w.writerow(["Question", "Answer"])
+            w.writerows([c.get("question", ""), c.get("answer", "")] for c in ss.flashcards)
+            st.download_button(
+                "⬇️ Download Flashcards (CSV)", data=out.getvalue().encode("utf-8"),
+                file_name=f"{slug}_flashcards.csv",
+                mime="text/csv"
+            )
+
+        render_flip_cards(
+            ss.flashcards,
+            min_width_px=min_card_width,
+            height_px=card_height,
+            gap_px=grid_gap,
+            search_query=search_q,
+            order=ss.flashcards_order or list(range(len(ss.flashcards))),
+            blobs=ss.flashcards_blob,
+        )
+    else:
+        st.info("No flashcards yet. Generate your pack from the sidebar.")
+    st.markdown('</div>', unsafe_allow_html=True)
+
 # =========================
 # Tabs Layout (Summary / Map / Flashcards / Quiz / About)
+# Radio-based tabs: only the active section runs, so hidden tabs cost nothing per rerun
 # =========================
-tab_summary, tab_diagram, tab_cards, tab_quiz, tab_about = st.tabs(
-    ["Summary", "Visual Map", "Flashcards", "Quiz", "About"]
-)
+active_tab = st.radio("Section", ["Summary", "Visual Map", "Flashcards", "Quiz", "About"],
+                      horizontal=True, key="active_tab", label_visibility="collapsed")
 
 # ===== Summary Tab =====
-with tab_summary:
+if active_tab == "Summary":
     st.markdown('<div class="section">', unsafe_allow_html=True)
     if ss.summary:
         st.subheader(f"📌 Summary: {ss.generated_topic or topic}")
         st.markdown(ss.summary, unsafe_allow_html=True)
         buf = io.BytesIO(ss.summary.encode("utf-8"))
         st.download_button("⬇️ Download Summary (HTML)", data=buf,
-                           file_name=f"{(ss.generated_topic or topic).replace(' ','_').lower()}_summary.html",
+                           file_name=f"{slug}_summary.html",
                            mime="text/html")
     else:
         st.info("Enter a topic in the sidebar and click **Generate / Refresh** to create your study pack.")
     st.markdown('</div>', unsafe_allow_html=True)
 
 # ===== Diagram Tab =====
-with tab_diagram:
+if active_tab == "Visual Map":
     st.markdown('<div class="section">', unsafe_allow_html=True)
     st.subheader("🗺️ Visual Map (from Summary)")
     if ss.summary:
         c1, c2, c3 = st.columns(3)
-        with c1: leaves = st.slider("Leaves per branch", 2, 6, 4, key="leaves")
-        with c2: wrap_len = st.slider("Wrap width (chars)", 16, 36, 24, step=2, key="wrap_len")
-        with c3: layout_choice = st.selectbox("Layout", ["TB (top→bottom)", "LR (left→right)"], index=0, key="layout")
+        for key in ("leaves", "wrap_len", "layout"):
+            _restore_widget(key)
+        with c1: leaves = st.slider("Leaves per branch", 2, 6, key="leaves",
+                                    on_change=_keep_widget, args=("leaves",))
+        with c2: wrap_len = st.slider("Wrap width (chars)", 16, 36, step=2, key="wrap_len",
+                                      on_change=_keep_widget, args=("wrap_len",))
+        with c3: layout_choice = st.selectbox("Layout", ["TB (top→bottom)", "LR (left→right)"], key="layout",
+                                              on_change=_keep_widget, args=("layout",))
         orientation = "TB" if layout_choice.startswith("TB") else "LR"
         try:
-            dot = build_summary_dot(ss.generated_topic or topic, ss.summary,
-                                    leaves_per_para=leaves, wrap_len=wrap_len, orientation=orientation)
-            st.graphviz_chart(dot, use_container_width=True)
+            dot = cached_dot(ss.generated_topic or topic, ss.summary_parsed, leaves, wrap_len, orientation)
+            if _graphviz_available():
+                st.image(render_dot(dot))
+            else:
+                # no Graphviz binaries on this host: let the browser lay it out
+                st.graphviz_chart(dot, use_container_width=True)
             st.download_button("⬇️ Download DOT",
                                data=dot.encode("utf-8"),
-                               file_name=f"{(ss.generated_topic or topic).replace(' ','_').lower()}_map.dot",
+                               file_name=f"{slug}_map.dot",
                                mime="text/vnd.graphviz")
         except Exception as e:
             st.warning(f"Diagram failed: {e}")
@@ -428,48 +543,11 @@ with tab_diagram:
     st.markdown('</div>', unsafe_allow_html=True)
 
 # ===== Flashcards Tab =====
-with tab_cards:
-    st.markdown('<div class="section">', unsafe_allow_html=True)
-    st.subheader(f"🃏 Flashcards {f'({len(ss.flashcards)})' if ss.flashcards else ''}")
-    if ss.flashcards:
-        col1, col2, col3 = st.columns([2,1,1])
-        with col1:
-            search_q = st.text_input("Search in cards", "", help="Filter by text in question or answer")
-        with col2:
-            show_csv = st.checkbox("Prepare export", value=False, help="Enable to download CSV")
-        with col3:
-            if st.button("🔀 Shuffle order"):
-                ss.flashcards_order = ss.flashcards_order or list(range(len(ss.flashcards)))
-                random.shuffle(ss.flashcards_order)
-
-        # Export CSV for flashcards
-        if show_csv:
-            out = io.StringIO()
-            out.write("Question,Answer\n")
-            for c in ss.flashcards:
-                q = csv_escape(c.get("question", ""))
-                a = csv_escape(c.get("answer", ""))
-                out.write(f'"{q}","{a}"\n')
-            st.download_button(
-                "⬇️ Download Flashcards (CSV)", data=out.getvalue().encode("utf-8"),
-                file_name=f"{(ss.generated_topic or topic).replace(' ','_').lower()}_flashcards.csv",
-                mime="text/csv"
-            )
-
-        render_flip_cards(
-            ss.flashcards,
-            min_width_px=min_card_width,
-            height_px=card_height,
-            gap_px=grid_gap,
-            search_query=search_q,
-            order=ss.flashcards_order or list(range(len(ss.flashcards)))
-        )
-    else:
-        st.info("No flashcards yet. Generate your pack from the sidebar.")
-    st.markdown('</div>', unsafe_allow_html=True)
+if active_tab == "Flashcards":
+    _flashcards_section()
 
 # ===== Quiz Tab =====
-with tab_quiz:
+if active_tab == "Quiz":
     st.markdown('<div class="section">', unsafe_allow_html=True)
     st.subheader(f"📝 Quiz {f'({len(ss.quiz)} questions)' if ss.quiz else ''}")
     if ss.quiz:
@@ -477,65 +555,50 @@ with tab_quiz:
         answered = sum(1 for i in range(total) if ss.answers.get(f"quiz_{i}") is not None)
         st.progress(answered / total if total else 0.0, text=f"Answered {answered}/{total}")
 
-        with st.form("quiz_form"):
-            for i, q in enumerate(ss.quiz):
-                qid = f"quiz_{i}"
-                if qid not in ss.answers:
-                    ss.answers[qid] = None
-
-                st.markdown(
-                    f"<div style='background:rgba(255,255,255,.06); padding:12px; border-radius:10px; "
-                    f"border:1px solid rgba(255,255,255,.08); box-shadow: inset 0 1px 0 rgba(255,255,255,.04); "
-                    f"margin: 10px 0;'><strong>Q{i+1}: {q['question']}</strong></div>",
-                    unsafe_allow_html=True,
-                )
+        # No st.form: each radio records its answer on change, so picks survive section switches
+        for i, q in enumerate(ss.quiz):
+            qid = f"quiz_{i}"
+            if qid not in ss.answers:
+                ss.answers[qid] = None
+
+            st.markdown(
+                f"<div style='background:rgba(255,255,255,.06); padding:12px; border-radius:10px; "
+                f"border:1px solid rgba(255,255,255,.08); box-shadow: inset 0 1px 0 rgba(255,255,255,.04); "
+                f"margin: 10px 0;'><strong>Q{i+1}: {q['question']}</strong></div>",
+                unsafe_allow_html=True,
+            )
 
-                options = q.get("options") or []
-                placeholder = "— Select an answer —"
-                options_display = [placeholder] + options
+            options = q.get("options") or []
+            options_display = [QUIZ_PLACEHOLDER] + options
 
+            key = f"radio_{i}_{ss.quiz_epoch}"  # epoch ensures reset/default works
+            if key not in ss:
                 current = ss.answers[qid]  # None on first render
-                default_idx = options_display.index(current) if current in options else 0
-
-                choice = st.radio(
-                    "Select your answer:",
-                    options=options_display,
-                    index=default_idx,
-                    key=f"radio_{i}_{ss.quiz_epoch}",  # epoch ensures reset/default works
-                )
-
-                # Store None if placeholder is selected
-                ss.answers[qid] = None if choice == placeholder else choice
-                st.markdown("---")
-
-            c1, c2 = st.columns(2)
-            with c1:
-                submitted = st.form_submit_button("✅ Submit All Answers")
-            with c2:
-                if st.form_submit_button("♻️ Reset Answers"):
-                    for i in range(len(ss.quiz)):
-                        ss.answers[f"quiz_{i}"] = None
-                    ss.quiz_epoch += 1  # force radios back to placeholder
-                    st.experimental_rerun()
+                ss[key] = current if current in options else QUIZ_PLACEHOLDER
+            st.radio("Select your answer:", options=options_display, key=key,
+                     on_change=_record_answer, args=(qid, key))
+            st.markdown("---")
+
+        c1, c2 = st.columns(2)
+        with c1:
+            just_submitted = st.button("✅ Submit All Answers")
+        with c2:
+            st.button("♻️ Reset Answers", on_click=_reset_quiz)
+        if just_submitted:
+            ss.quiz_submitted = True
 
         # ===== CSV-safe export & summary =====
-        if submitted:
+        if ss.quiz_submitted:
             ss.score = 0
             rows = []
-            out = io.StringIO()
-            out.write("Question,Your Answer,Correct Answer,Result\n")
 
             for i, q in enumerate(ss.quiz):
                 qid = f"quiz_{i}"
-                user_ans = ss.answers[qid]
+                user_ans = ss.answers.get(qid)
                 correct = q.get("answer", "")
                 result = "Correct" if user_ans == correct else "Wrong"
                 ss.score += int(user_ans == correct)
 
-                qtext_csv = csv_escape(q.get("question", ""))
-                user_csv  = csv_escape(user_ans or "")
-                corr_csv  = csv_escape(correct)
-
                 rows.append({
                     "Question": q.get("question",""),
                     "Your Answer": user_ans,
@@ -543,18 +606,21 @@ with tab_quiz:
                     "Result": result
                 })
 
-                out.write(f'"{qtext_csv}",""{user_csv}"",""{corr_csv}"",""{result}""\n'.replace('""', '"'))
+            out = io.StringIO()
+            w = csv.writer(out, quoting=csv.QUOTE_ALL)
+            w.writerow(["Question", "Your Answer", "Correct Answer", "Result"])
+            w.writerows([r["Question"], r["Your Answer"] or "", r["Correct Answer"], r["Result"]] for r in rows)
 
             st.subheader("📊 Quiz Summary")
             st.table(rows)
             st.subheader(f"🎯 Final Score: {ss.score}/{total}")
-            if ss.score == total and total > 0:
+            if just_submitted and ss.score == total and total > 0:
                 st.balloons()
 
             st.download_button(
                 "⬇️ Download Results (CSV)",
                 data=out.getvalue().encode("utf-8"),
-                file_name=f"{(ss.generated_topic or topic).replace(' ','_').lower()}_quiz_results.csv",
+                file_name=f"{slug}_quiz_results.csv",
                 mime="text/csv"
             )
     else:
@@ -562,7 +628,7 @@ with tab_quiz:
     st.markdown('</div>', unsafe_allow_html=True)
 
 # ===== About Tab =====
-with tab_about:
+if active_tab == "About":
     st.markdown('<div class="section">', unsafe_allow_html=True)
     st.subheader("ℹ️ About this app")
     st.markdown("""
@@ -570,6 +636,6 @@ with tab_about:
 - **Interactive learning**: colorful flip-cards with keyboard support, search, shuffle, and quick “flip all/reset” actions.
 - **Summary-anchored**: flashcards and MCQs come strictly from the generated summary for coherence.
 - **Export friendly**: one-click downloads for summary (HTML), flashcards (CSV), and quiz results (CSV).
-- **No extra packages**: pure Streamlit + CSS — deploy anywhere Spaces/Streamlit runs.
+- **Light dependencies**: Streamlit + the OpenAI SDK; the visual map is laid out server-side when Graphviz is installed, otherwise in the browser.
 """)
     st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,33 @@
+(function(){
+  var root = document.querySelector(".fc-root");
+  if(!root) return;
+  var cards = Array.prototype.slice.call(root.querySelectorAll('.fc-card'));
+  function flip(c){ c.classList.toggle('is-flipped'); }
+  cards.forEach(function(c){
+    c.addEventListener('click', function(){ flip(c); });
+    c.addEventListener('keydown', function(e){
+      if (e.code === 'Space' || e.key === ' ' || e.key === 'Enter') {
+        e.preventDefault(); flip(c);
+      }
+    });
+  });
+  var flipAll = root.querySelector('#flipAll');
+  var resetAll = root.querySelector('#resetAll');
+  if (flipAll) flipAll.addEventListener('click', function(){
+    cards.forEach(function(c){ c.classList.add('is-flipped'); });
+  });
+  if (resetAll) resetAll.addEventListener('click', function(){
+    cards.forEach(function(c){ c.classList.remove('is-flipped'); });
+  });
+  var shuffleBtn = root.querySelector('#shuffle');
+  if (shuffleBtn) {
+    shuffleBtn.addEventListener('click', function(){
+      var grid = root.querySelector('.fc-grid');
+      var nodes = Array.prototype.slice.call(grid.children);
+      for (var i = nodes.length - 1; i > 0; i--) {
+        var j = Math.floor(Math.random() * (i + 1));
+        grid.insertBefore(nodes[j], nodes[i]);
+      }
+    });
+  }
+})();
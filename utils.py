@@ -1,6 +1,10 @@
 import os
-import importlib
+import re
+import json
+import time
+import asyncio
 from typing import Optional
+import streamlit as st
 from prompts import (
     SUMMARY_PROMPT,
     FLASHCARDS_PROMPT, QUIZ_PROMPT,
@@ -8,18 +12,57 @@ from prompts import (
 )
 
 MODEL_NAME = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_TIMEOUT_SECONDS = 30.0
+OPENAI_CONNECT_TIMEOUT_SECONDS = 5.0
+OPENAI_MAX_RETRIES = 2  # SDK retries with exponential backoff
+BATCH_POLL_SECONDS = 10
+BATCH_TIMEOUT_SECONDS = 60 * 60
 
+# Q:/A: card blocks; the question may wrap (up to the next "A:"/"Q:" line) and the
+# answer runs until a blank line, the next "Q:" line, or the end
+FLASH_RE = re.compile(
+    r"^[ \t]*Q:[ \t]*((?:(?!^[ \t]*(?:Q|A):).)+?)\s*^[ \t]*A:[ \t]*(.+?)\s*(?=\n[ \t]*\n|^[ \t]*Q:|\Z)",
+    re.M | re.S,
+)
+# Q: / Options: / Answer: triples; the question may wrap, options and answer are one line each
+QUIZ_RE = re.compile(
+    r"^[ \t]*Q:[ \t]*((?:(?!^[ \t]*(?:Q|Options|Answer):).)+?)\s*"
+    r"^[ \t]*Options:[ \t]*([^\n]+?)\s*^[ \t]*Answer:[ \t]*([^\n]+)",
+    re.M | re.S,
+)
+# "A) opt1 B) opt2 ..." → split before each whitespace-preceded letter marker
+OPTION_SPLIT_RE = re.compile(r"\s+(?=[A-D]\))")
+
+def _client_options(openai_mod):
+    # Bound every request so a hung call cannot stall the script indefinitely
+    return {
+        "timeout": openai_mod.Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+        "max_retries": OPENAI_MAX_RETRIES,
+    }
+
+@st.cache_resource(show_spinner=False)
 def _get_openai_client():
+    # One client (and HTTP connection pool) shared across reruns and sessions
     key = os.getenv("OPENAI_API_KEY")
     if not key:
         raise RuntimeError("OPENAI_API_KEY is missing.")
     try:
-        openai_mod = importlib.import_module("openai")
-        OpenAI = getattr(openai_mod, "OpenAI")
-        return OpenAI(api_key=key)
+        import openai
+        return openai.OpenAI(api_key=key, **_client_options(openai))
     except Exception as e:
         raise RuntimeError(f"OpenAI client init failed: {e}")
 
+def _get_async_openai_client():
+    # Built per asyncio.run(): the async HTTP pool is bound to its event loop.
+    key = os.getenv("OPENAI_API_KEY")
+    if not key:
+        raise RuntimeError("OPENAI_API_KEY is missing.")
+    try:
+        import openai
+        return openai.AsyncOpenAI(api_key=key, **_client_options(openai))
+    except Exception as e:
+        raise RuntimeError(f"OpenAI async client init failed: {e}")
+
 def call_openai(prompt: str, model: str = MODEL_NAME, temperature: float = 0.7) -> str:
     client = _get_openai_client()
     resp = client.chat.completions.create(
@@ -29,60 +72,219 @@ def call_openai(prompt: str, model: str = MODEL_NAME, temperature: float = 0.7)
     )
     return resp.choices[0].message.content.strip()
 
+async def acall_openai(client, prompt: str, model: str = MODEL_NAME, temperature: float = 0.7) -> str:
+    resp = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+    )
+    return resp.choices[0].message.content.strip()
+
+async def astream_openai(client, prompt: str, model: str = MODEL_NAME, temperature: float = 0.7):
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        stream=True,
+    )
+    async for chunk in stream:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+# =========================
+# Prompt builders & parsers (shared by sync and async paths)
+# =========================
+def _flashcards_request(topic: str, n: int, summary: Optional[str]):
+    if summary:
+        return FLASHCARDS_FROM_SUMMARY_PROMPT.format(summary=summary, n=n), 0.2
+    return FLASHCARDS_PROMPT.format(topic=topic, n=n), 0.5
+
+def _quiz_request(topic: str, n: int, summary: Optional[str]):
+    if summary:
+        return QUIZ_FROM_SUMMARY_PROMPT.format(summary=summary, n=n), 0.2
+    return QUIZ_PROMPT.format(topic=topic, n=n), 0.5
+
+def _parse_flashcards(text: str, n: int):
+    cards = [{"question": " ".join(m.group(1).split()), "answer": m.group(2).strip()}
+             for m in FLASH_RE.finditer(text)]
+    return cards[:n]
+
+def _split_options(opts_text: str):
+    opts_text = opts_text.strip()
+    parts = OPTION_SPLIT_RE.split(opts_text)
+    options = [p[2:].strip() for p in parts if len(p) >= 2 and p[1] == ")" and p[0] in "ABCD"]
+    # No "A)"-style markers (e.g. "A. one B. two"): keep the raw text answerable
+    return options or ([opts_text] if opts_text else [])
+
+def _parse_quiz(text: str, n: int):
+    quizzes = [{"question": " ".join(m.group(1).split()),
+                "options": _split_options(m.group(2))[:4],
+                "answer": m.group(3).strip()}
+               for m in QUIZ_RE.finditer(text)]
+    return quizzes[:n]
+
+# =========================
+# Sync API
+# =========================
 def generate_summary(topic: str) -> str:
     return call_openai(SUMMARY_PROMPT.format(topic=topic), temperature=0.4)
 
 def generate_flashcards(topic: str, n: int = 10, summary: Optional[str] = None):
-    if summary:
-        prompt = FLASHCARDS_FROM_SUMMARY_PROMPT.format(summary=summary, n=n)
-        temperature = 0.2
-    else:
-        prompt = FLASHCARDS_PROMPT.format(topic=topic, n=n)
-        temperature = 0.5
-
-    text = call_openai(prompt, temperature=temperature)
-    cards, question, answer = [], None, None
-    for raw_line in text.splitlines():
-        line = raw_line.strip()
-        if line.startswith("Q:"):
-            question = line[2:].strip()
-        elif line.startswith("A:") and question:
-            answer = line[2:].strip()
-            cards.append({"question": question, "answer": answer})
-            question, answer = None, None
-        if len(cards) >= n:
-            break
-    return cards[:n]
+    prompt, temperature = _flashcards_request(topic, n, summary)
+    return _parse_flashcards(call_openai(prompt, temperature=temperature), n)
 
 def generate_quiz(topic: str, n: int = 10, summary: Optional[str] = None):
-    if summary:
-        prompt = QUIZ_FROM_SUMMARY_PROMPT.format(summary=summary, n=n)
-        temperature = 0.2
-    else:
-        prompt = QUIZ_PROMPT.format(topic=topic, n=n)
-        temperature = 0.5
-
-    text = call_openai(prompt, temperature=temperature)
-    quizzes, question, options, answer = [], None, [], None
-    for raw_line in text.splitlines():
-        line = raw_line.strip()
-        if line.startswith("Q:"):
-            question = line[2:].strip()
-        elif line.startswith("Options:"):
-            opts_text = line[len("Options:"):].strip()
-            tokens = opts_text.replace("A)", "|A)").replace("B)", "|B)").replace("C)", "|C)").replace("D)", "|D)").split("|")
-            tokens = [t for t in tokens if t]
-            options = []
-            for t in tokens:
-                t = t.strip()
-                if len(t) >= 2 and t[1] == ")":
-                    options.append(t[2:].strip())
-                else:
-                    options.append(t)
-        elif line.startswith("Answer:") and question:
-            answer = line[len("Answer:"):].strip()
-            quizzes.append({"question": question, "options": options[:4], "answer": answer})
-            question, options, answer = None, [], None
-        if len(quizzes) >= n:
-            break
-    return quizzes[:n]
+    prompt, temperature = _quiz_request(topic, n, summary)
+    return _parse_quiz(call_openai(prompt, temperature=temperature), n)
+
+# =========================
+# Async API (flashcards + quiz run concurrently once the summary exists)
+# =========================
+async def astream_flashcards(client, topic: str, n: int = 10, summary: Optional[str] = None):
+    """Yield each flashcard as soon as the next "Q:" shows its answer is complete."""
+    prompt, temperature = _flashcards_request(topic, n, summary)
+    buf, emitted = "", 0
+    async for piece in astream_openai(client, prompt, temperature=temperature):
+        buf += piece
+        if "\n" not in piece:
+            continue
+        # the last block may still be streaming its answer
+        for card in _parse_flashcards(buf, n)[emitted:-1]:
+            emitted += 1
+            yield card
+    for card in _parse_flashcards(buf, n)[emitted:]:
+        yield card
+
+async def agenerate_flashcards(client, topic: str, n: int = 10, summary: Optional[str] = None, on_card=None):
+    cards = []
+    async for card in astream_flashcards(client, topic, n=n, summary=summary):
+        cards.append(card)
+        if on_card:
+            on_card(card)
+    return cards
+
+async def agenerate_quiz(client, topic: str, n: int = 10, summary: Optional[str] = None):
+    prompt, temperature = _quiz_request(topic, n, summary)
+    return _parse_quiz(await acall_openai(client, prompt, temperature=temperature), n)
+
+async def generate_all(topic: str, n_cards: int = 10, n_quiz: int = 10, summary: Optional[str] = None,
+                       on_card=None):
+    """Return (summary, flashcards, quiz); pass `summary` to reuse an existing one.
+
+    A falsy `n_cards` / `n_quiz` skips that part and returns None for it.
+    `on_card` is called with each flashcard as it streams in.
+    """
+    async def _skipped():
+        return None
+
+    async with _get_async_openai_client() as client:
+        if not summary:
+            summary = await acall_openai(client, SUMMARY_PROMPT.format(topic=topic), temperature=0.4)
+        cards, quiz = await asyncio.gather(
+            agenerate_flashcards(client, topic, n=n_cards, summary=summary, on_card=on_card) if n_cards else _skipped(),
+            agenerate_quiz(client, topic, n=n_quiz, summary=summary) if n_quiz else _skipped(),
+        )
+    return summary, cards, quiz
+
+# =========================
+# Batch API (economy mode: ~50% cheaper, results can take minutes)
+# =========================
+def submit_batch(prompts: list, model: str = MODEL_NAME,
+                 poll_seconds: float = BATCH_POLL_SECONDS, timeout: float = BATCH_TIMEOUT_SECONDS) -> list:
+    """Run [{"prompt": ..., "temperature": ...}] through the Batch API; return texts in input order."""
+    client = _get_openai_client()
+    lines = [
+        json.dumps({
+            "custom_id": f"req-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": [{"role": "user", "content": p["prompt"]}],
+                "temperature": p.get("temperature", 0.7),
+            },
+        })
+        for i, p in enumerate(prompts)
+    ]
+    batch_file = client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+    batch = None
+    try:
+        batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions",
+                                      completion_window="24h")
+
+        deadline = time.monotonic() + timeout
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if time.monotonic() > deadline:
+                # Stop billing for results nobody will read
+                try:
+                    client.batches.cancel(batch.id)
+                except Exception:
+                    pass
+                raise RuntimeError(f"Batch {batch.id} still '{batch.status}' after {int(timeout)}s; cancelled it.")
+            time.sleep(poll_seconds)
+            batch = client.batches.retrieve(batch.id)
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'.")
+
+        # "completed" only means the batch finished; individual requests can still fail
+        failed = batch.request_counts.failed if batch.request_counts else 0
+        if failed or batch.error_file_id or not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id}: {failed or 'some'} of {len(prompts)} requests failed"
+                               f"{_batch_error_detail(client, batch.error_file_id)}.")
+
+        results = {}
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                raise RuntimeError(f"Batch request {record.get('custom_id')} failed: {record.get('error')}")
+            results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+        missing = [f"req-{i}" for i in range(len(prompts)) if f"req-{i}" not in results]
+        if missing:
+            raise RuntimeError(f"Batch {batch.id} returned no output for {', '.join(missing)}.")
+        return [results[f"req-{i}"] for i in range(len(prompts))]
+    finally:
+        _delete_batch_files(client, batch_file.id, batch)
+
+def _delete_batch_files(client, input_file_id, batch) -> None:
+    """Best-effort removal of a batch's input/output/error files from OpenAI storage."""
+    file_ids = [input_file_id]
+    if batch is not None:
+        file_ids += [batch.output_file_id, batch.error_file_id]
+    for file_id in filter(None, file_ids):
+        try:
+            client.files.delete(file_id)
+        except Exception:
+            pass
+
+def _batch_error_detail(client, error_file_id) -> str:
+    """First error from a batch error file, formatted for a message suffix."""
+    if not error_file_id:
+        return ""
+    for line in client.files.content(error_file_id).text.splitlines():
+        if line.strip():
+            record = json.loads(line)
+            error = record.get("error") or ((record.get("response") or {}).get("body") or {}).get("error")
+            return f" (first error on {record.get('custom_id')}: {error})"
+    return ""
+
+def generate_summary_batch(topic: str) -> str:
+    return submit_batch([{"prompt": SUMMARY_PROMPT.format(topic=topic), "temperature": 0.4}])[0]
+
+def generate_all_batch(topic: str, n_cards: int = 10, n_quiz: int = 10, summary: Optional[str] = None):
+    """Batch-API twin of generate_all: summary batch (if needed), then cards + quiz in one batch."""
+    if not summary:
+        summary = generate_summary_batch(topic)
+    prompts = []
+    if n_cards:
+        prompt, temperature = _flashcards_request(topic, n_cards, summary)
+        prompts.append({"prompt": prompt, "temperature": temperature})
+    if n_quiz:
+        prompt, temperature = _quiz_request(topic, n_quiz, summary)
+        prompts.append({"prompt": prompt, "temperature": temperature})
+    texts = iter(submit_batch(prompts)) if prompts else iter(())
+    cards = _parse_flashcards(next(texts), n_cards) if n_cards else None
+    quiz = _parse_quiz(next(texts), n_quiz) if n_quiz else None
+    return summary, cards, quiz